@@ -1,7 +1,14 @@
 import os
+import hashlib
+import functools
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import pandas as pd
+import polars as pl
+import matplotlib
+matplotlib.use("Agg")  # file output only; no GUI backend probing
 import matplotlib.pyplot as plt
+from matplotlib.font_manager import FontProperties
 
 # =============================
 # PATHS (match your structure)
@@ -9,143 +16,272 @@ import matplotlib.pyplot as plt
 BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 RAW_DIR = os.path.join(BASE_DIR, "raw_data")
 FIG_DIR = os.path.join(BASE_DIR, "figures")
+CACHE_DIR = os.path.join(FIG_DIR, ".cache")
 os.makedirs(FIG_DIR, exist_ok=True)
 
+# Web-sized output: 18x6 in at 120 dpi is ~2160x720 px
+FIG_DPI = 120
+
+# Bar-label font, resolved once and shared by every label
+LABEL_FONT = FontProperties(size=9, weight="bold")
+
+# Every season with a passing + rushing export in raw_data
+SEASONS = list(range(2015, 2026))
+
 YEARS_2015_2020 = list(range(2015, 2021))
 YEARS_2020_2025 = list(range(2020, 2026))  # overlap intentional
 
+# Rushing columns that feed RBR; parsed as Float64 and null-checked together
+RBR_INPUTS = ["Succ%", "Y/A", "Yds", "TD"]
+
+# PFR summary row spellings (matched exactly, no per-row lowercasing)
+LEAGUE_AVERAGE_ROWS = ["league average", "League Average", "LEAGUE AVERAGE"]
+
 # =============================
 # LOADERS
 # =============================
-def load_passing_year(year: int) -> pd.DataFrame:
-    path = os.path.join(RAW_DIR, f"{year} passing.csv")
-    df = pd.read_csv(path)
-    df = df[df["Player"].astype(str).str.lower() != "league average"].copy()
-    df["Season"] = year
-    df["QBR"] = pd.to_numeric(df["QBR"], errors="coerce")
-    return df.dropna(subset=["QBR"])
+def season_files(kind: str) -> dict:
+    # Season -> raw CSV path ("passing" or "rushing"); the same dict feeds the
+    # loader and its cache key, so they always cover the same files
+    return {year: os.path.join(RAW_DIR, f"{year} {kind}.csv") for year in SEASONS}
 
-def load_rushing_year(year: int) -> pd.DataFrame:
-    path = os.path.join(RAW_DIR, f"{year} rushing.csv")
+def scan_passing(files: dict) -> pl.LazyFrame:
+    # One lazy scan per season, concatenated; Season comes from the file's year.
+    # Season is int16 and Player categorical so group/sort keys hash small ints
+    frames = [
+        pl.scan_csv(path, schema_overrides={"QBR": pl.Float64}, null_values=["", "NA"])
+          .with_columns(pl.lit(year, dtype=pl.Int16).alias("Season"))
+          .select(["Player", "Season", "QBR"])
+        for year, path in files.items()
+    ]
 
-    # Try header=0; fallback to header=1 (PFR quirk)
-    try:
-        df = pd.read_csv(path)
-        if "Player" not in df.columns:
-            raise ValueError("Missing Player column")
-    except Exception:
-        df = pd.read_csv(path, header=1)
+    return (
+        pl.concat(frames)
+          .filter(~pl.col("Player").is_in(LEAGUE_AVERAGE_ROWS))
+          .drop_nulls("QBR")
+          .with_columns(pl.col("Player").cast(pl.Categorical))
+    )
 
-    df = df[df["Player"].astype(str).str.lower() != "league average"].copy()
-    df["Season"] = year
+def _header_line(path: str) -> int:
+    # PFR quirk: some exports have a group-header (and blank) line above the real header
+    with open(path, encoding="utf-8") as f:
+        for i, line in enumerate(f):
+            if line.startswith("Rk,"):
+                return i
+    raise ValueError(f"Missing Player column in {path}")
 
-    for col in ["Succ%", "Y/A", "Yds", "TD"]:
-        df[col] = pd.to_numeric(df[col], errors="coerce")
+def scan_rushing(files: dict) -> pl.LazyFrame:
+    # Header offset differs per file, so scan each year and concat lazily.
+    # Numeric columns are typed by the parser; blanks become nulls.
+    # Only the RBR inputs are selected, so other columns are never materialized
+    frames = []
+    for year, path in files.items():
+        frames.append(
+            pl.scan_csv(
+                path,
+                skip_lines=_header_line(path),
+                schema_overrides=dict.fromkeys(RBR_INPUTS, pl.Float64),
+                null_values=["", "NA"],
+            )
+              .with_columns(pl.lit(year, dtype=pl.Int16).alias("Season"))
+              .select(["Player", "Season", *RBR_INPUTS])
+        )
 
-    return df.dropna(subset=["Succ%", "Y/A", "Yds", "TD"])
+    return (
+        pl.concat(frames)
+          .filter(~pl.col("Player").is_in(LEAGUE_AVERAGE_ROWS))
+          .drop_nulls(RBR_INPUTS)
+          .with_columns(pl.col("Player").cast(pl.Categorical))
+    )
 
 # =============================
-# METRICS
+# PARQUET CACHE
 # =============================
-def compute_rbr(df: pd.DataFrame) -> pd.DataFrame:
-    def zscore(s):
-        return (s - s.mean()) / (s.std(ddof=0) + 1e-9)
-
-    out = df.copy()
-    out["z_succ"] = out.groupby("Season")["Succ%"].transform(zscore)
-    out["z_ypa"]  = out.groupby("Season")["Y/A"].transform(zscore)
-    out["z_yds"]  = out.groupby("Season")["Yds"].transform(zscore)
-    out["z_td"]   = out.groupby("Season")["TD"].transform(zscore)
-    out["RBR"] = (out["z_succ"] + out["z_ypa"] + out["z_yds"] + out["z_td"]) / 4.0
-    return out
+def _cache_file(name: str, sources: list) -> str:
+    # One file per frame and input set; a different file list gets a new key
+    key = hashlib.sha1("\n".join(sorted(sources)).encode()).hexdigest()[:12]
+    return os.path.join(CACHE_DIR, f"{name}-{key}.parquet")
+
+def _cache_fresh(path: str, sources: list) -> bool:
+    # Stale once any raw CSV (or this script) is newer than the cache
+    if not os.path.exists(path):
+        return False
+    newest = max(os.path.getmtime(p) for p in [*sources, __file__])
+    return os.path.getmtime(path) >= newest
+
+def collect_cached(plans: dict) -> list:
+    # plans: name -> (build, raw CSV paths), where build() returns the CSV
+    # LazyFrame. Fresh frames are read back from Parquet without building the
+    # plan; the rest collect from CSV together and are written out
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    lazy, rebuild = [], []
+    for name, (build, sources) in plans.items():
+        path = _cache_file(name, sources)
+        if _cache_fresh(path, sources):
+            lazy.append(pl.scan_parquet(path))
+            rebuild.append(None)
+        else:
+            lazy.append(build())
+            rebuild.append(path)
+
+    frames = pl.collect_all(lazy, engine="streaming")
+    for df, path in zip(frames, rebuild):
+        if path is not None:
+            df.write_parquet(path, compression="zstd")
+    return frames
 
 # =============================
-# PLOTTING (VERTICAL BARS + NAMES INSIDE BARS)
+# METRICS
 # =============================
-def plot_grouped_top5_by_year(df: pd.DataFrame, value_col: str, title: str, out_file: str):
-    seasons = sorted(df["Season"].unique())
-
-    top = (
-        df.sort_values(["Season", value_col], ascending=[True, False])
-          .groupby("Season")
-          .head(5)
-          .reset_index(drop=True)
+def compute_rbr(lf: pl.LazyFrame) -> pl.LazyFrame:
+    # Per-season z-scores as window expressions, fused into the scan plan
+    def zscore(col: str) -> pl.Expr:
+        c = pl.col(col)
+        return (c - c.mean().over("Season")) / (c.std(ddof=0).over("Season") + 1e-9)
+
+    return (
+        lf.with_columns(
+            zscore("Succ%").alias("z_succ"),
+            zscore("Y/A").alias("z_ypa"),
+            zscore("Yds").alias("z_yds"),
+            zscore("TD").alias("z_td"),
+        )
+        .with_columns(
+            ((pl.col("z_succ") + pl.col("z_ypa") + pl.col("z_yds") + pl.col("z_td")) / 4.0).alias("RBR")
+        )
     )
 
+def top5(df: pd.DataFrame, value_col: str) -> pd.DataFrame:
+    # Top five per season, ranked 0..4 in _r, with bar labels in Last;
+    # computed once and sliced per chart. np.partition finds each season's
+    # fifth-best value in linear time; only rows at or above it get sorted,
+    # stably, so ties keep PFR's row order
+    vals = df[value_col].to_numpy()
+    seasons = df["Season"].to_numpy()
+
+    picks = []
+    for s in np.unique(seasons):
+        idx = np.flatnonzero(seasons == s)
+        if len(idx) > 5:
+            idx = idx[vals[idx] >= np.partition(vals[idx], -5)[-5]]
+        picks.append(idx[np.argsort(-vals[idx], kind="stable")][:5])
+
+    return df.iloc[np.concatenate(picks)].assign(
+        _r=np.concatenate([np.arange(len(p)) for p in picks]),
+        Last=lambda d: d["Player"].astype(str).str.rsplit(" ", n=1).str[-1],
+    )
+
+# =============================
+# PLOTTING (VERTICAL BARS + NAMES INSIDE BARS)
+# =============================
+def plot_grouped_top5_by_year(ax: plt.Axes, top: pd.DataFrame, seasons: list, value_col: str, title: str, out_file: str):
     bar_width = 0.14
     x = np.arange(len(seasons))
 
-    plt.figure(figsize=(18, 6))
+    # Reshape once into (Season x rank) matrices (ranks come from top5);
+    # reindex picks this chart's seasons, so no masked copy of top is needed
+    vals = top.pivot(index="Season", columns="_r", values=value_col).reindex(seasons).to_numpy()
+    lastnames = top.pivot(index="Season", columns="_r", values="Last").reindex(seasons).to_numpy()
+
+    # Figure is shared across charts; start from a blank Axes
+    ax.clear()
 
     # Slightly more headroom so labels don’t clip
-    ymax = top[value_col].max()
-    plt.ylim(0, ymax * 1.12)
-
-    for rank in range(5):
-        slice_r = top.groupby("Season").nth(rank).reset_index()
-        offsets = x + (rank - 2) * bar_width
-
-        bars = plt.bar(offsets, slice_r[value_col], width=bar_width)
-
-        # Put LAST NAME INSIDE BAR near top
-        for b, name in zip(bars, slice_r["Player"].astype(str)):
-            last = name.split(" ")[-1]
-            height = b.get_height()
-
-            # Place text inside bar (a little below the top)
-            y_text = height * 0.94  # inside the bar
-            plt.text(
-                b.get_x() + b.get_width()/2,
-                y_text,
-                last,
-                ha="center",
-                va="top",
-                fontsize=9,
-                fontweight="bold",
-                color="white",
-                rotation=90,   # keeps it readable even in narrow bars
-                clip_on=True
-            )
+    ymax = np.nanmax(vals)
+    ax.set_ylim(0, ymax * 1.12)
+
+    # All 5 x N bars in one call, laid out rank-major: row r of the (5, N)
+    # offsets matrix is rank r across seasons and keeps the r-th cycle color
+    offsets_mat = x[None, :] + (np.arange(5)[:, None] - 2) * bar_width
+    x_flat = offsets_mat.ravel()
+    h_flat = vals.T.ravel()
+    colors = np.repeat(plt.cm.tab10.colors[:5], len(seasons), axis=0)
+    ax.bar(x_flat, h_flat, width=bar_width, color=colors)
 
-    plt.xticks(x, seasons)
-    plt.ylabel(value_col)
-    plt.title(title)
-    plt.tight_layout()
-    plt.savefig(out_file, dpi=220)
-    plt.close()
+    # Put LAST NAME INSIDE BAR near top (a little below the top)
+    for xi, height, last in zip(x_flat, h_flat, lastnames.T.ravel()):
+        ax.text(
+            xi,
+            height * 0.94,  # inside the bar
+            last,
+            ha="center",
+            va="top",
+            fontproperties=LABEL_FONT,
+            color="white",
+            rotation=90,   # keeps it readable even in narrow bars
+            clip_on=True
+        )
+
+    ax.set_xticks(x, seasons)
+    ax.set_ylabel(value_col)
+    ax.set_title(title)
+    ax.figure.savefig(out_file, dpi=FIG_DPI, metadata={"Software": None})
+
+@functools.lru_cache(maxsize=None)
+def _shared_axes() -> plt.Axes:
+    # One Figure/Axes per process, reused for every chart it draws. All charts
+    # share the canvas and label layout, so margins are fixed once (what
+    # tight_layout settles on)
+    fig, ax = plt.subplots(figsize=(18, 6))
+    fig.subplots_adjust(left=0.04, right=0.99, top=0.94, bottom=0.065)
+    return ax
+
+def _plot_one(task: dict):
+    # Module-level so ProcessPoolExecutor can pickle it
+    plot_grouped_top5_by_year(_shared_axes(), **task)
 
 def main():
-    qb_all = pd.concat([load_passing_year(y) for y in range(2015, 2026)], ignore_index=True)
-    rb_all = pd.concat([load_rushing_year(y) for y in range(2015, 2026)], ignore_index=True)
-    rb_all = compute_rbr(rb_all)
-
-    # QB grouped charts
-    plot_grouped_top5_by_year(
-        qb_all[qb_all["Season"].isin(YEARS_2015_2020)],
-        "QBR",
-        "Top 5 Quarterbacks by QBR (2015–2020)",
-        os.path.join(FIG_DIR, "top5_qb_2015_2020.png")
-    )
-    plot_grouped_top5_by_year(
-        qb_all[qb_all["Season"].isin(YEARS_2020_2025)],
-        "QBR",
-        "Top 5 Quarterbacks by QBR (2020–2025)",
-        os.path.join(FIG_DIR, "top5_qb_2020_2025.png")
+    # Both plans run concurrently in one collect (or come from the Parquet cache);
+    # pandas only from here on (plotting boundary)
+    passing = season_files("passing")
+    rushing = season_files("rushing")
+    qb_all, rb_all = (
+        df.to_pandas()
+        for df in collect_cached({
+            "qb_all": (lambda: scan_passing(passing), list(passing.values())),
+            "rb_all": (lambda: compute_rbr(scan_rushing(rushing)), list(rushing.values())),
+        })
     )
 
-    # RB grouped charts
-    plot_grouped_top5_by_year(
-        rb_all[rb_all["Season"].isin(YEARS_2015_2020)],
-        "RBR",
-        "Top 5 Running Backs by RBR (2015–2020)",
-        os.path.join(FIG_DIR, "top5_rb_2015_2020.png")
-    )
-    plot_grouped_top5_by_year(
-        rb_all[rb_all["Season"].isin(YEARS_2020_2025)],
-        "RBR",
-        "Top 5 Running Backs by RBR (2020–2025)",
-        os.path.join(FIG_DIR, "top5_rb_2020_2025.png")
-    )
+    qb_top = top5(qb_all, "QBR")
+    rb_top = top5(rb_all, "RBR")
+
+    tasks = [
+        # QB grouped charts
+        dict(
+            top=qb_top,
+            seasons=YEARS_2015_2020,
+            value_col="QBR",
+            title="Top 5 Quarterbacks by QBR (2015–2020)",
+            out_file=os.path.join(FIG_DIR, "top5_qb_2015_2020.png"),
+        ),
+        dict(
+            top=qb_top,
+            seasons=YEARS_2020_2025,
+            value_col="QBR",
+            title="Top 5 Quarterbacks by QBR (2020–2025)",
+            out_file=os.path.join(FIG_DIR, "top5_qb_2020_2025.png"),
+        ),
+        # RB grouped charts
+        dict(
+            top=rb_top,
+            seasons=YEARS_2015_2020,
+            value_col="RBR",
+            title="Top 5 Running Backs by RBR (2015–2020)",
+            out_file=os.path.join(FIG_DIR, "top5_rb_2015_2020.png"),
+        ),
+        dict(
+            top=rb_top,
+            seasons=YEARS_2020_2025,
+            value_col="RBR",
+            title="Top 5 Running Backs by RBR (2020–2025)",
+            out_file=os.path.join(FIG_DIR, "top5_rb_2020_2025.png"),
+        ),
+    ]
+
+    # Charts are independent files; render them in parallel processes
+    with ProcessPoolExecutor(max_workers=min(len(tasks), os.cpu_count() or 1)) as ex:
+        list(ex.map(_plot_one, tasks))
 
     print("Done: regenerated grouped charts with labels inside bars.")
 